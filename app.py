@@ -1,68 +1,36 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import gspread
 import datetime
+import os
+import time
 from oauth2client.service_account import ServiceAccountCredentials
-from collections import defaultdict
-import re
-
-# CONFIG
-GOOGLE_SHEET_NAME = "midex_2025"
-EVENT_TABS = {
-    "May Stableford": "Standard Event",
-    "Rover Medal": "Major",
-    "June Medal": "Elevated Event",
-    "Stableford Handicap Trophy": "Major",
-    "Club Championships (r1)": "Playoff Event",
-    "Club Championships (r2)": "Playoff Event",
-    "July Stableford": "Standard Event",
-    "August Stableford (Red Tee)": "Standard Event",
-    "August Medal": "Elevated Event",
-    "August Stableford": "Standard Event",
-    "Mid Sussex Masters": "Major",
-    "September Stableford": "Standard Event"
-}
-
-POINTS_TABLE = {
-    "Standard Event": [300, 180, 114, 81, 66, 60, 54, 51, 48, 45, 42, 39, 36, 34, 33, 32],
-    "Elevated Event": [550, 330, 209, 149, 121, 110, 99, 94, 88, 83, 77, 72, 66, 63, 61, 58],
-    "Major": [750, 450, 285, 203, 165, 150, 135, 128, 120, 113, 105, 98, 90, 86, 83, 80],
-    "Playoff Event": [1200, 720, 456, 324, 264, 240, 216, 204, 192, 180, 168, 156, 144, 137, 132, 127],
-}
-
-EVENT_DATES = [
-    "04/05/2025",
-    "25/05/2025",
-    "08/06/2025",
-    "22/06/2025",
-    "05/07/2025",
-    "06/07/2025",
-    "26/07/2025",
-    "03/08/2025",
-    "16/08/2025",
-    "24/08/2025",
-    "13/09/2025",
-    "27/09/2025"
-]
-
-def parse_position(pos_str):
-    """Extract numeric part from '1st', '2nd', '10th' etc."""
-    if not isinstance(pos_str, str):
-        return None
-    match = re.match(r"^(\d+)", pos_str.strip())
-    return int(match.group(1)) if match else None
 
-@st.cache_data(ttl=300)
-def load_all_event_data():
-    all_data = {}
-    for sheet_name in EVENT_TABS:
-        try:
-            df = load_event_results(sheet_name)
-            all_data[sheet_name] = df
-        except Exception as e:
-            all_data[sheet_name] = pd.DataFrame(columns=["Position", "Name", "Score"])
-            st.warning(f"⚠️ Failed to load {sheet_name}: {e}")
-    return all_data
+from midex.core import (
+    EVENT_DATES,
+    EVENT_DATES_DT,
+    EVENT_TABS,
+    GOOGLE_SHEET_NAME,
+    POINTS_TABLE,
+    aggregate_points,
+    empty_event_results,
+    fetch_all_event_results,
+    fetch_event_results_per_tab,
+    read_event_cache,
+    write_event_cache,
+)
+
+# event results are saved here and reused for a day; point MIDEX_CACHE_DIR at a
+# shared volume when running more than one worker
+CACHE_DIR = os.environ.get("MIDEX_CACHE_DIR", "cache")
+EVENT_CACHE_PATH = os.path.join(CACHE_DIR, "events.parquet")
+EVENT_CACHE_MAX_AGE = 24 * 60 * 60  # seconds
+FETCH_RETRY_DELAY = 300  # seconds to wait after a failed fetch before trying again
+
+# selectbox options and their positions, built once instead of on every rerun
+EVENT_NAMES = list(EVENT_TABS)
+EVENT_INDEX = {name: i for i, name in enumerate(EVENT_NAMES)}
 
 @st.cache_resource
 def get_gsheet_client():
@@ -73,13 +41,43 @@ def get_gsheet_client():
     creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
     return gspread.authorize(creds)
 
+@st.cache_resource
+def get_spreadsheet(name):
+    # open() is a Drive lookup by name, so only do it once per process
+    return get_gsheet_client().open(name)
+
+class RecentFetchFailure(Exception):
+    """A fetch failed less than FETCH_RETRY_DELAY seconds ago and is not retried yet."""
+
+@st.cache_resource
+def get_fetch_failures():
+    # {key: (failed at, error message)}, shared by every session in this process;
+    # st.cache_data doesn't cache exceptions, so without this every rerun would
+    # retry a failing fetch
+    return {}
+
+def fetch_with_backoff(key, fetch, force=False):
+    failures = get_fetch_failures()
+    if not force and key in failures:
+        failed_at, error = failures[key]
+        if time.time() - failed_at < FETCH_RETRY_DELAY:
+            raise RecentFetchFailure(error)
+    try:
+        result = fetch()
+    except Exception as e:
+        failures[key] = (time.time(), str(e))
+        raise
+    failures.pop(key, None)
+    return result
+
 @st.cache_data(ttl=300)
 def load_eligible_player_names():
-    client = get_gsheet_client()
-    sheet = client.open(GOOGLE_SHEET_NAME).worksheet("entries")
-    
-    # Get all values from column A starting from row 2
-    data = sheet.col_values(1)[1:]  # Skips the header (row 1)
+    spreadsheet = get_spreadsheet(GOOGLE_SHEET_NAME)
+
+    # Get all values from column A starting from row 2 (skips the header) in one
+    # values.get call, rather than a worksheet metadata lookup plus col_values
+    response = spreadsheet.values_get("'entries'!A2:A", params={"majorDimension": "COLUMNS"})
+    data = response.get("values", [[]])[0]
 
     eligible_names = pd.Series(data).dropna().unique().tolist()  # Remove NaN and get unique names
     total_entries = len(eligible_names)  # Total entries are the count of unique names
@@ -88,124 +86,109 @@ def load_eligible_player_names():
     return [name.strip() for name in eligible_names], total_entries, total_prize_fund
 
 @st.cache_data(ttl=300)
-def load_event_results(sheet_name):
-    client = get_gsheet_client()
-    sheet = client.open(GOOGLE_SHEET_NAME).worksheet(sheet_name)
-    data = sheet.get_all_values()
-
-    # checks length of first row, if its less than 4, return empty dataframe
-    if not data or len(data[0]) < 4:
-        return pd.DataFrame(columns=["Position", "Name", "Score"])
-
-    # iterate over the data
-    results = []
-    for row in data:
-        try:
-            name = row[0].strip()
-            position = row[1].strip()
-            score = row[3].strip()
-            results.append((position, name, score))
-        except (IndexError, ValueError):
-            continue  # skip rows that don't conform
-
-    if not results:
-        return pd.DataFrame(columns=["Position", "Name", "Score"])
-
-    df = pd.DataFrame(results, columns=["Position", "Name", "Score"])
-    return df
-
-def calculate_points(event_type, position):
-    table = POINTS_TABLE.get(event_type, [])
-    return table[position - 1] if 1 <= position <= len(table) else 0
-
-def aggregate_points(event_data, entrants_list):
-    player_points = defaultdict(int)
-    event_breakdown = defaultdict(list)
-
-    for sheet_name, label in EVENT_TABS.items():
-        df = event_data.get(sheet_name, pd.DataFrame())
-        if df.empty:
-            continue
-
-        for _, row in df.iterrows():
-            name = row.get("Name", "").strip()
-            pos_raw = row.get("Position", None)
-            pos = parse_position(pos_raw)
-            if pos is None:
-                continue
-
-            pts = calculate_points(label, pos)
-            player_points[name] += pts
-            event_breakdown[name].append((sheet_name, pts))
-
-    if not player_points:
-        return pd.DataFrame(columns=["Name", "Points", "Events"])
-
-    leaderboard = pd.DataFrame([
-        {"Name": name, "Points": points, "Events": event_breakdown[name]}
-        for name, points in player_points.items() if name in entrants_list and points > 0
-    ])
-    return leaderboard.sort_values("Points", ascending=False).reset_index(drop=True)
+def load_all_event_results():
+    spreadsheet = get_spreadsheet(GOOGLE_SHEET_NAME)
+    try:
+        return fetch_all_event_results(spreadsheet), {}
+    except gspread.exceptions.APIError as e:
+        # batchGet fails as a whole with a 400 if any one range is rejected;
+        # quota, auth and server errors would only fail again per tab
+        if e.code != 400:
+            raise
+        return fetch_event_results_per_tab(spreadsheet)
+
+@st.cache_data(max_entries=4)
+def load_event_cache(path, mtime):
+    # mtime is only part of the cache key, so a rewritten file is read again
+    return read_event_cache(path)
+
+def remove_event_cache():
+    try:
+        os.remove(EVENT_CACHE_PATH)
+    except FileNotFoundError:
+        pass
 
+def load_saved_event_results(mtime):
+    if mtime is None:
+        return None
+    try:
+        return load_event_cache(EVENT_CACHE_PATH, mtime)
+    except Exception:
+        # unreadable or not the layout write_event_cache produces; treat it
+        # like a missing file so the next step fetches and rewrites it
+        remove_event_cache()
+        return None
 
-def styled_leaderboard(df):
-    def highlight(row):
-        if row.name == 0:
-            return ["background-color: #FFD700; font-weight: bold;"] * len(row)
-        elif row.name == 1:
-            return ["background-color: #C0C0C0; font-weight: bold;"] * len(row)
-        elif row.name == 2:
-            return ["background-color: #CD7F32; font-weight: bold;"] * len(row)
-        else:
-            return [""] * len(row)
-
-    df_styled = (
-        df.style
-        .apply(highlight, axis=1)
-        .format({"Points": "{:,.0f}"})
-        .set_properties(**{"text-align": "center", "font-family": "Georgia", "font-size": "16px"})
-        .hide(axis="index")
+def load_all_event_results_cached(force_refresh=False):
+    try:
+        mtime = os.path.getmtime(EVENT_CACHE_PATH)
+    except OSError:
+        mtime = None  # nothing saved yet
+
+    if mtime is not None and not force_refresh and time.time() - mtime < EVENT_CACHE_MAX_AGE:
+        saved = load_saved_event_results(mtime)
+        if saved is not None:
+            return saved
+        mtime = None
+
+    try:
+        event_data, errors = fetch_with_backoff("events", load_all_event_results, force=force_refresh)
+    except Exception as e:
+        saved = load_saved_event_results(mtime)
+        if saved is not None:
+            st.warning(f"⚠️ Failed to refresh event results, showing the last saved copy: {e}")
+            return saved
+        st.warning(f"⚠️ Failed to load event results: {e}")
+        return {name: empty_event_results() for name in EVENT_TABS}
+
+    if errors:
+        # fill the failed tabs from the saved copy, but don't keep a partial
+        # copy for a day
+        saved = load_saved_event_results(mtime)
+        for sheet_name, error in errors.items():
+            if saved is not None:
+                event_data[sheet_name] = saved[sheet_name]
+                st.warning(f"⚠️ Failed to refresh {sheet_name}, showing the last saved copy: {error}")
+            else:
+                st.warning(f"⚠️ Failed to load {sheet_name}: {error}")
+        return event_data
+
+    try:
+        write_event_cache(event_data, EVENT_CACHE_PATH)
+    except OSError as e:
+        st.warning(f"⚠️ Could not save event results to {EVENT_CACHE_PATH}: {e}")
+    return event_data
+
+@st.cache_data(max_entries=8)
+def load_leaderboard(event_data, entrants):
+    # keyed on the event frames and entrants themselves, so it is rebuilt exactly
+    # when either changes; entrants must be a tuple to be hashable
+    leaderboard = aggregate_points(event_data, entrants)
+    leaderboard["Position"] = np.arange(1, len(leaderboard) + 1, dtype=np.int16)
+    return leaderboard
+
+def get_leader(leaderboard):
+    if leaderboard.empty:
+        return "TBD", 0
+    return leaderboard.iloc[0]["Name"], leaderboard.iloc[0]["Points"]
+
+@st.cache_data(max_entries=8)
+def leaderboard_html(columns, records):
+    # keyed on the rows themselves, so the table is only rebuilt when the standings change
+    df = pd.DataFrame.from_records(records, columns=columns)
+    # gold / silver / bronze come from the row position in the page stylesheet
+    return df.to_html(
+        classes="leaderboard", index=False, border=0, formatters={"Points": "{:,.0f}".format}
     )
-    return st.markdown(df_styled.to_html(escape=False), unsafe_allow_html=True)
 
-def df_to_html_table(df, header_color="#5E2CA5", header_text_color="white"):
-    table_style = """
-    <style>
-    .responsive-table {
-        width: 100%;
-        overflow-x: auto;
-        margin-bottom: 1em;
-        border-collapse: collapse;
-        font-family: 'Georgia', serif;
-    }
-    .responsive-table thead {
-        background-color: """ + header_color + """;
-        color: """ + header_text_color + """;
-    }
-    .responsive-table th, .responsive-table td {
-        padding: 10px;
-        border: 1px solid #ddd;
-        text-align: center;
-        white-space: nowrap;
-    }
-    .responsive-table tr:nth-child(even) {
-        background-color: #f9f9f9;
-    }
-    </style>
-    """
+def styled_leaderboard(df):
+    records = tuple(df.itertuples(index=False, name=None))
+    return st.markdown(leaderboard_html(tuple(df.columns), records), unsafe_allow_html=True)
 
-    html = table_style + "<div style='overflow-x:auto;'>"
-    html += "<table class='responsive-table'><thead><tr>"
-    for col in df.columns:
-        html += f"<th>{col}</th>"
-    html += "</tr></thead><tbody>"
-    for _, row in df.iterrows():
-        html += "<tr>"
-        for item in row:
-            html += f"<td>{item}</td>"
-        html += "</tr>"
-    html += "</tbody></table></div>"
-    return html
+def df_to_html_table(df):
+    # .responsive-table is styled once in the page stylesheet
+    table_html = df.to_html(classes="responsive-table", index=False, border=0, escape=True)
+    return f"<div style='overflow-x:auto;'>{table_html}</div>"
 
 
 
@@ -253,6 +236,47 @@ st.markdown("""
         padding: 1rem;
         text-align: center;
     }
+
+    /* Tables from df_to_html_table */
+    .responsive-table {
+        width: 100%;
+        overflow-x: auto;
+        margin-bottom: 1em;
+        border-collapse: collapse;
+        font-family: 'Georgia', serif;
+    }
+    .responsive-table thead {
+        background-color: #5E2CA5;
+        color: white;
+    }
+    .responsive-table th, .responsive-table td {
+        padding: 10px;
+        border: 1px solid #ddd;
+        text-align: center;
+        white-space: nowrap;
+    }
+    .responsive-table tr:nth-child(even) {
+        background-color: #f9f9f9;
+    }
+
+    /* Leaderboard, with the podium rows highlighted */
+    .leaderboard td, .leaderboard th {
+        text-align: center;
+        font-family: Georgia;
+        font-size: 16px;
+    }
+    .leaderboard tbody tr:nth-child(-n+3) {
+        font-weight: bold;
+    }
+    .leaderboard tbody tr:nth-child(1) {
+        background-color: #FFD700;
+    }
+    .leaderboard tbody tr:nth-child(2) {
+        background-color: #C0C0C0;
+    }
+    .leaderboard tbody tr:nth-child(3) {
+        background-color: #CD7F32;
+    }
 </style>
 """, unsafe_allow_html=True)
 
@@ -264,19 +288,27 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
-entrants_list, entries, prize_pool = load_eligible_player_names()
-
-event_data = load_all_event_data()
-leaderboard_df = aggregate_points(event_data, entrants_list)
-leaderboard_df["Position"] = leaderboard_df.index + 1
-
+if st.sidebar.button("Refresh now"):
+    # refetch on the next run, but keep events.parquet as the fallback if that fails
+    load_all_event_results.clear()
+    load_eligible_player_names.clear()
+    st.session_state.force_refresh = True
+    st.rerun()
+force_refresh = st.session_state.pop("force_refresh", False)
+
+try:
+    entrants_list, entries, prize_pool = fetch_with_backoff(
+        "entries", load_eligible_player_names, force=force_refresh
+    )
+except Exception as e:
+    st.warning(f"⚠️ Failed to load entries: {e}")
+    entrants_list, entries, prize_pool = [], 0, 0
 
-# entries = leaderboard_df["Name"].nunique()
-leader_name = leaderboard_df.iloc[0]["Name"] if not leaderboard_df.empty else "TBD"
-leader_points = leaderboard_df.iloc[0]["Points"] if not leaderboard_df.empty else 0
+event_data = load_all_event_results_cached(force_refresh)
+leaderboard_df = load_leaderboard(event_data, tuple(entrants_list))
+leader_name, leader_points = get_leader(leaderboard_df)
 
 today = datetime.datetime.today()
-event_dates_dt = [datetime.datetime.strptime(date, "%d/%m/%Y") for date in EVENT_DATES]
 
 # determine which have results
 events_with_results = {
@@ -284,16 +316,14 @@ events_with_results = {
     if not df.empty
 }
 
-# only include events that dont have results
-future_events = [
-    (name, d) for (name, _), d in zip(EVENT_TABS.items(), event_dates_dt)
-    if d >= today and name not in events_with_results
-]
-
-if future_events:
-    next_event, next_date = future_events[0]
-else:
-    next_event, next_date = list(EVENT_TABS.keys())[0], EVENT_DATES[0]
+# first upcoming event that doesn't have results yet
+next_event, next_date = next(
+    (
+        (name, d) for name, d in zip(EVENT_TABS, EVENT_DATES_DT)
+        if d >= today and name not in events_with_results
+    ),
+    (EVENT_NAMES[0], EVENT_DATES_DT[0]),
+)
 
 col1, col2, col3 = st.columns(3)
 with col1:
@@ -304,7 +334,7 @@ with col2:
     st.caption(f"🏆 {leader_points} points")
 with col3:
     st.metric("Next Event", next_event)
-    st.caption(f"📅 {next_date.strftime('%d %b %Y') if isinstance(next_date, datetime.datetime) else next_date}")
+    st.caption(f"📅 {next_date.strftime('%d %b %Y')}")
 
 tabs = st.tabs(["📋 Rules / Entry", "🏆 Leaderboard", "📈 Event Results", "💯 Point Rewards Table"])
 
@@ -335,15 +365,12 @@ with tabs[0]:
         """)
 
     st.markdown("### 🗓 Events")
-    event_df = pd.DataFrame([
-        {
-            "Date": date,
-            "Competition": name,
-            "Type": label,
-            "Points Allocation": POINTS_TABLE[label][0]
-        }
-        for date, (name, label) in zip(EVENT_DATES, EVENT_TABS.items())
-    ])
+    event_df = pd.DataFrame({
+        "Date": EVENT_DATES,
+        "Competition": EVENT_NAMES,
+        "Type": list(EVENT_TABS.values()),
+        "Points Allocation": [POINTS_TABLE[label][0] for label in EVENT_TABS.values()],
+    })
 
     st.markdown(df_to_html_table(event_df), unsafe_allow_html=True)
 
@@ -363,12 +390,12 @@ with tabs[1]:
 with tabs[2]:
     st.subheader("🔍 Event Breakdown")
     if "selected_event" not in st.session_state:
-        st.session_state.selected_event = list(EVENT_TABS.keys())[0]
+        st.session_state.selected_event = EVENT_NAMES[0]
 
-    selected_event = st.selectbox("Select event", list(EVENT_TABS.keys()), index=list(EVENT_TABS.keys()).index(st.session_state.selected_event))
+    selected_event = st.selectbox("Select event", EVENT_NAMES, index=EVENT_INDEX[st.session_state.selected_event])
     st.session_state.selected_event = selected_event
     try:
-        results_df = event_data.get(selected_event, pd.DataFrame())
+        results_df = event_data.get(selected_event, empty_event_results())
         if results_df.empty:
             st.info("No results yet for this event.")
         else:
@@ -0,0 +1,206 @@
+import datetime
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# CONFIG
+GOOGLE_SHEET_NAME = "midex_2025"
+EVENT_TABS = {
+    "May Stableford": "Standard Event",
+    "Rover Medal": "Major",
+    "June Medal": "Elevated Event",
+    "Stableford Handicap Trophy": "Major",
+    "Club Championships (r1)": "Playoff Event",
+    "Club Championships (r2)": "Playoff Event",
+    "July Stableford": "Standard Event",
+    "August Stableford (Red Tee)": "Standard Event",
+    "August Medal": "Elevated Event",
+    "August Stableford": "Standard Event",
+    "Mid Sussex Masters": "Major",
+    "September Stableford": "Standard Event"
+}
+
+POINTS_TABLE = {
+    "Standard Event": [300, 180, 114, 81, 66, 60, 54, 51, 48, 45, 42, 39, 36, 34, 33, 32],
+    "Elevated Event": [550, 330, 209, 149, 121, 110, 99, 94, 88, 83, 77, 72, 66, 63, 61, 58],
+    "Major": [750, 450, 285, 203, 165, 150, 135, 128, 120, 113, 105, 98, 90, 86, 83, 80],
+    "Playoff Event": [1200, 720, 456, 324, 264, 240, 216, 204, 192, 180, 168, 156, 144, 137, 132, 127],
+}
+
+# a typo in an event type would otherwise only surface halfway through a render
+_unknown_types = sorted(set(EVENT_TABS.values()) - set(POINTS_TABLE))
+if _unknown_types:
+    raise ValueError(f"EVENT_TABS uses event types missing from POINTS_TABLE: {_unknown_types}")
+
+# POINTS_ARR[EVENT_TYPE_ID[event_type], place - 1]; the extra last column is
+# zero so any unpaid place can be looked up without a bounds check
+EVENT_TYPE_ID = {event_type: i for i, event_type in enumerate(POINTS_TABLE)}
+MAX_PLACES = max(len(points) for points in POINTS_TABLE.values())
+POINTS_ARR = np.zeros((len(POINTS_TABLE), MAX_PLACES + 1), dtype=np.int16)
+for event_type, points in POINTS_TABLE.items():
+    POINTS_ARR[EVENT_TYPE_ID[event_type], :len(points)] = points
+
+# event type id for each event tab, so aggregation never looks up labels per row
+SHEET_TYPE_ID = {sheet_name: EVENT_TYPE_ID[label] for sheet_name, label in EVENT_TABS.items()}
+
+EVENT_DATES = [
+    "04/05/2025",
+    "25/05/2025",
+    "08/06/2025",
+    "22/06/2025",
+    "05/07/2025",
+    "06/07/2025",
+    "26/07/2025",
+    "03/08/2025",
+    "16/08/2025",
+    "24/08/2025",
+    "13/09/2025",
+    "27/09/2025"
+]
+EVENT_DATES_DT = tuple(datetime.datetime.strptime(date, "%d/%m/%Y") for date in EVENT_DATES)
+
+# leading digits of a finishing position ('1st', '2nd', '10th' etc.), capped
+# at four so a match always fits the int16 Position column
+POSITION_RE = re.compile(r"^\s*(\d{1,4})(?!\d)")
+
+def empty_event_results():
+    return pd.DataFrame(columns=["Position", "Name", "Score"])
+
+def event_range(sheet_name):
+    """A1 range covering the columns read from an event tab."""
+    return "'{}'!A:D".format(sheet_name.replace("'", "''"))
+
+def parse_event_values(data):
+    # checks width of the sheet, if its less than 4 columns, return empty dataframe
+    if not data or max(len(row) for row in data) < 4:
+        return empty_event_results()
+
+    # iterate over the data
+    results = []
+    for row in data:
+        try:
+            # the values API trims trailing empty cells, so pad back out to A:D
+            row = row + [""] * (4 - len(row))
+            name = row[0].strip()
+            position = row[1].strip()
+            score = row[3].strip()
+            results.append((position, name, score))
+        except (IndexError, ValueError):
+            continue  # skip rows that don't conform
+
+    if not results:
+        return empty_event_results()
+
+    df = pd.DataFrame(results, columns=["Position", "Name", "Score"])
+    return df
+
+def fetch_all_event_results(spreadsheet):
+    # one values.batchGet round trip for every event tab
+    response = spreadsheet.values_batch_get(ranges=[event_range(name) for name in EVENT_TABS])
+
+    # value ranges come back in request order; empty tabs have no "values" key
+    return {
+        sheet_name: parse_event_values(value_range.get("values", []))
+        for sheet_name, value_range in zip(EVENT_TABS, response.get("valueRanges", []))
+    }
+
+def fetch_event_results(spreadsheet, sheet_name):
+    response = spreadsheet.values_get(event_range(sheet_name))
+    return parse_event_values(response.get("values", []))
+
+def fetch_event_results_per_tab(spreadsheet, max_workers=8):
+    """Fetch each event tab with its own request, overlapping them on a thread pool.
+
+    Fallback for when the single batchGet is rejected. Returns the results and a
+    dict of error messages for tabs that failed; those tabs come back empty.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            sheet_name: executor.submit(fetch_event_results, spreadsheet, sheet_name)
+            for sheet_name in EVENT_TABS
+        }
+
+    event_data, errors = {}, {}
+    for sheet_name, future in futures.items():
+        error = future.exception()
+        if error is None:
+            event_data[sheet_name] = future.result()
+        else:
+            event_data[sheet_name] = empty_event_results()
+            errors[sheet_name] = str(error)
+    return event_data, errors
+
+# mkstemp creates files as 0600; the saved copy gets the mode a plain open()
+# would have given it, so workers on a shared volume can read each other's
+# (the umask can only be read by setting it, so that happens once, at import)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+EVENT_CACHE_MODE = 0o666 & ~_UMASK
+
+def write_event_cache(event_data, path):
+    cache_dir = os.path.dirname(path) or "."
+    os.makedirs(cache_dir, exist_ok=True)
+    combined = pd.concat(
+        [df.assign(Sheet=sheet_name) for sheet_name, df in event_data.items()],
+        ignore_index=True,
+    )
+    # write to a temp file of our own, then rename, so readers never see a
+    # half-written file even when several sessions refresh at once
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            combined.to_parquet(f, index=False)
+        os.chmod(tmp_path, EVENT_CACHE_MODE)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+def read_event_cache(path):
+    combined = pd.read_parquet(path)
+    event_data = {name: empty_event_results() for name in EVENT_TABS}
+    for sheet_name, df in combined.groupby("Sheet", sort=False):
+        if sheet_name in event_data:
+            event_data[sheet_name] = df.drop(columns="Sheet").reset_index(drop=True)
+    return event_data
+
+def aggregate_points(event_data, entrants_list):
+    frames = {
+        sheet_name: df[["Name", "Position"]]
+        for sheet_name, df in event_data.items()
+        if sheet_name in SHEET_TYPE_ID and not df.empty
+    }
+    if not frames:
+        return pd.DataFrame(columns=["Name", "Points"])
+
+    # work on one frame, each row tagged with its event type id
+    combined = pd.concat(frames.values(), ignore_index=True)
+    type_ids = np.repeat(
+        [SHEET_TYPE_ID[sheet_name] for sheet_name in frames],
+        [len(df) for df in frames.values()],
+    )
+    combined["EventType"] = pd.Categorical.from_codes(type_ids, categories=list(POINTS_TABLE))
+    combined["Name"] = combined["Name"].astype(str).str.strip()
+
+    # leading digits of '1st', '2nd', '10th' etc.
+    digits = combined["Position"].astype(str).str.extract(POSITION_RE, expand=False)
+    valid = digits.notna()
+    combined = combined[valid].copy()
+    combined["Position"] = digits[valid].astype(np.int16)
+
+    # unpaid places are pointed at the trailing zero column
+    # categories are in POINTS_TABLE order, so the codes are the EVENT_TYPE_ID values
+    type_ids = combined["EventType"].cat.codes.to_numpy()
+    pos = combined["Position"].to_numpy()
+    pos = np.where((pos >= 1) & (pos <= MAX_PLACES), pos, MAX_PLACES + 1)
+    combined["Points"] = POINTS_ARR[type_ids, pos - 1]
+
+    leaderboard = combined.groupby("Name", sort=False)["Points"].sum().astype(np.int32).reset_index()
+
+    leaderboard = leaderboard[leaderboard["Name"].isin(entrants_list) & (leaderboard["Points"] > 0)]
+    # stable so tied players keep the order they first scored in
+    return leaderboard.sort_values("Points", ascending=False, kind="stable").reset_index(drop=True)